@@ -6,10 +6,14 @@ Import and use these functions in your API endpoints for database operations.
 """
 
 from pymongo import MongoClient
+import bson
+from bson import ObjectId
 from datetime import datetime, timezone
+import asyncio
+import logging
 import os
 from dotenv import load_dotenv
-from typing import Union
+from typing import Optional, Union
 from pydantic import BaseModel
 
 # Load environment variables from .env file
@@ -25,24 +29,129 @@ if database_url and database_name:
     _client = MongoClient(database_url)
     db = _client[database_name]
 
-# Helper functions for common database operations
-def create_document(collection_name: str, data: Union[BaseModel, dict]):
-    """Insert a single document with timestamp"""
-    if db is None:
-        raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
+logger = logging.getLogger(__name__)
+
+# Batched writes: documents queued by queue_document_raw() are flushed with
+# insert_many once BATCH_MAX_SIZE items are pending or BATCH_MAX_WAIT elapsed
+BATCH_MAX_SIZE = 500
+BATCH_MAX_WAIT = 0.05  # seconds
+# Backpressure: once this many documents are pending (e.g. MongoDB is down),
+# queueing raises asyncio.QueueFull and the caller reports no id
+BATCH_QUEUE_MAXSIZE = 4 * BATCH_MAX_SIZE
 
+_pending: Optional[asyncio.Queue] = None
+_flusher_task: Optional[asyncio.Task] = None
+
+def _to_document(data: Union[BaseModel, dict]) -> dict:
     # Convert Pydantic model to dict if needed
     if isinstance(data, BaseModel):
-        data_dict = data.model_dump()
-    else:
-        data_dict = data.copy()
+        return data.model_dump()
+    return data.copy()
 
+def _stamp(data_dict: dict) -> dict:
     data_dict['created_at'] = datetime.now(timezone.utc)
     data_dict['updated_at'] = datetime.now(timezone.utc)
+    return data_dict
+
+def close_database():
+    """Close the shared MongoClient and its connection pool"""
+    if _client is not None:
+        _client.close()
+
+# Indexes backing the per-user lookups
+INDEXES = [
+    ("checklistitem", [("user_id", 1)]),
+    ("trainingsession", [("user_id", 1)]),
+    ("analysisreport", [("user_id", 1)]),
+]
+
+def ensure_indexes():
+    """Create the indexes in INDEXES if they don't exist yet"""
+    if db is None:
+        return
+    for collection_name, keys in INDEXES:
+        db[collection_name].create_index(keys)
+
+# Helper functions for common database operations
+def create_document(collection_name: str, data: Union[BaseModel, dict]):
+    """Insert a single document with timestamp"""
+    if db is None:
+        raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
 
-    result = db[collection_name].insert_one(data_dict)
+    result = db[collection_name].insert_one(_stamp(_to_document(data)))
     return str(result.inserted_id)
 
+def queue_document(collection_name: str, data: Union[BaseModel, dict]):
+    """Queue a document for batched insert and return its pre-allocated id"""
+    return queue_document_raw(collection_name, _to_document(data))
+
+def queue_document_raw(collection_name: str, data_dict: dict):
+    """Like queue_document, but takes ownership of a plain dict without validating or copying it"""
+    if db is None:
+        raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
+    if _pending is None:
+        raise Exception("Batch writer not running. Call start_batch_writer() on startup.")
+
+    data_dict = _stamp(data_dict)
+    data_dict['_id'] = ObjectId()
+    # Fail the offending request here rather than the whole batch in insert_many;
+    # raises InvalidDocument / OverflowError for documents BSON can't encode
+    bson.encode(data_dict)
+    _pending.put_nowait((collection_name, data_dict))
+    return str(data_dict['_id'])
+
+def _insert_batch(batch: list):
+    groups = {}
+    for collection_name, data_dict in batch:
+        groups.setdefault(collection_name, []).append(data_dict)
+    for collection_name, docs in groups.items():
+        try:
+            db[collection_name].insert_many(docs, ordered=False)
+        except Exception:
+            logger.exception("Batched insert of %d documents into %s failed", len(docs), collection_name)
+
+async def _flush_pending(queue: asyncio.Queue):
+    loop = asyncio.get_running_loop()
+    while True:
+        item = await queue.get()
+        batch = []
+        deadline = loop.time() + BATCH_MAX_WAIT
+        # A None item is the shutdown sentinel: flush what we have and exit
+        while item is not None:
+            batch.append(item)
+            if len(batch) >= BATCH_MAX_SIZE:
+                break
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(queue.get(), remaining)
+            except asyncio.TimeoutError:
+                break
+        if batch:
+            await asyncio.to_thread(_insert_batch, batch)
+        if item is None:
+            return
+
+def start_batch_writer():
+    """Start the background task that flushes queued documents"""
+    global _pending, _flusher_task
+    if db is None or _flusher_task is not None:
+        return
+    _pending = asyncio.Queue(maxsize=BATCH_QUEUE_MAXSIZE)
+    _flusher_task = asyncio.create_task(_flush_pending(_pending))
+
+async def stop_batch_writer():
+    """Flush any queued documents and stop the background task"""
+    global _pending, _flusher_task
+    if _flusher_task is None:
+        return
+    # The queue may be full; wait for room for the shutdown sentinel
+    await _pending.put(None)
+    await _flusher_task
+    _pending = None
+    _flusher_task = None
+
 def get_documents(collection_name: str, filter_dict: dict = None, limit: int = None):
     """Get documents from collection"""
     if db is None:
@@ -53,3 +162,10 @@ def get_documents(collection_name: str, filter_dict: dict = None, limit: int = N
         cursor = cursor.limit(limit)
     
     return list(cursor)
+
+def aggregate_documents(collection_name: str, pipeline: list):
+    """Run an aggregation pipeline on a collection"""
+    if db is None:
+        raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
+
+    return list(db[collection_name].aggregate(pipeline))
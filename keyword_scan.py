@@ -0,0 +1,82 @@
+"""
+Compiled Keyword Scanning
+
+Aho-Corasick automaton over UTF-8 bytes with a Numba-compiled scan loop.
+Used by the analysis endpoint for long inputs, where a single compiled pass
+beats the regex engine. Numba is optional; check AVAILABLE before use.
+"""
+
+from collections import deque
+from typing import Sequence, Set
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+AVAILABLE = njit is not None
+
+def _scan(buf, delta, out):
+    state = 0
+    mask = 0
+    for i in range(buf.shape[0]):
+        state = delta[state, buf[i]]
+        mask |= out[state]
+    return mask
+
+if AVAILABLE:
+    _scan = njit(cache=True, nogil=True)(_scan)
+
+class KeywordAutomaton:
+    """
+    Finds which of up to 63 keywords occur in a text, in one pass.
+    Overlapping matches are all reported (e.g. "vorbereitet" and "bereit").
+    """
+
+    def __init__(self, keywords: Sequence[str]):
+        if len(keywords) > 63:
+            raise ValueError("KeywordAutomaton supports at most 63 keywords")
+        self.keywords = tuple(keywords)
+
+        # Build the trie
+        goto = [{}]
+        out = [0]
+        for bit, keyword in enumerate(self.keywords):
+            state = 0
+            for b in keyword.encode("utf-8"):
+                if b not in goto[state]:
+                    goto.append({})
+                    out.append(0)
+                    goto[state][b] = len(goto) - 1
+                state = goto[state][b]
+            out[state] |= 1 << bit
+
+        # Resolve failure links breadth-first into a dense transition table
+        delta = np.zeros((len(goto), 256), dtype=np.int32)
+        fail = [0] * len(goto)
+        queue = deque()
+        for b, nxt in goto[0].items():
+            delta[0, b] = nxt
+            queue.append(nxt)
+        while queue:
+            state = queue.popleft()
+            out[state] |= out[fail[state]]
+            delta[state] = delta[fail[state]]
+            for b, nxt in goto[state].items():
+                fail[nxt] = delta[fail[state], b]
+                delta[state, b] = nxt
+                queue.append(nxt)
+
+        self._delta = delta
+        self._out = np.array(out, dtype=np.int64)
+        # Compile now (or load from cache) with the same argument types find() uses,
+        # so the first long request doesn't pay for JIT compilation
+        self.find("")
+
+    def find(self, text: str) -> Set[str]:
+        """Return the set of keywords present in text"""
+        # surrogatepass: lone surrogates can arrive via JSON escapes; keywords never contain them
+        buf = np.frombuffer(text.encode("utf-8", "surrogatepass"), dtype=np.uint8)
+        mask = int(_scan(buf, self._delta, self._out))
+        return {k for bit, k in enumerate(self.keywords) if mask >> bit & 1}
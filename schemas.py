@@ -3,6 +3,10 @@ Database Schemas for MPU Preparation Platform
 
 Each Pydantic model represents a collection in MongoDB.
 Collection name = lowercase of class name.
+
+The API handlers write plain dicts with these fields directly (see
+queue_document_raw); the models here define the document shape and back
+the /schema endpoint.
 """
 
 from pydantic import BaseModel, Field